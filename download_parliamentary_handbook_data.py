@@ -7,15 +7,193 @@ data extracted from transcripts.
 # /// script
 # requires-python = ">=3.12"
 # dependencies = [
+#   "ijson",
 #   "requests"
 # ]
 # ///
 
+import collections
+import concurrent.futures as cf
+import itertools
 import sqlite3
+import threading
 import time
 
+import ijson
 import requests
 
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
+
+# A shared session keeps connections to the handbook API alive across requests,
+# rather than paying for a new connection and TLS handshake on every call.
+SESSION = requests.Session()
+SESSION.mount(
+    "https://",
+    HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=8,
+        max_retries=Retry(total=3, backoff_factor=0.5),
+    ),
+)
+
+
+# Start times of the most recent detail requests to the handbook API. This is shared
+# by every call to conditional_get_all, so the limit of 4 requests every 15 seconds
+# holds across consecutive batches of requests, not just within one.
+recent_requests = collections.deque(maxlen=4)
+recent_requests_lock = threading.Lock()
+
+
+def wait_for_request_slot():
+    """Wait until a request can start without exceeding 4 requests every 15 seconds."""
+
+    with recent_requests_lock:
+        # Only wait for what's left of the 15 seconds since the oldest of the recent
+        # requests started - time spent waiting for the server counts towards it.
+        if len(recent_requests) == recent_requests.maxlen:
+            time.sleep(max(0, recent_requests[0] + 15 - time.monotonic()))
+
+        recent_requests.append(time.monotonic())
+
+
+def get_if_modified(url, etag=None, last_modified=None, stream=False):
+    """
+    Retrieve the url, unless it hasn't changed since the given ETag/Last-Modified.
+
+    Returns None if the server responds that the resource is unchanged.
+
+    """
+
+    headers = {}
+
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+
+    response = SESSION.get(url, headers=headers, stream=stream)
+
+    response.raise_for_status()
+
+    if response.status_code == 304:
+        return None
+
+    return response
+
+
+def insert_json_items(db, response, prefix, statement, chunk=500):
+    """
+    Stream the records at prefix in a JSON response into the database.
+
+    Records are parsed incrementally as the response is downloaded and inserted
+    `chunk` at a time, rather than decoding the whole response first.
+
+    """
+
+    with response:
+        response.raw.decode_content = True
+
+        records = ijson.items(response.raw, prefix, use_float=True)
+
+        for rows in itertools.batched(records, chunk):
+            db.executemany(statement, rows)
+
+
+def load_validators(db, url):
+    """Return the (etag, last_modified) from the last retrieval of the url."""
+
+    for etag, last_modified in db.execute(
+        "SELECT etag, last_modified from http_cache where url = ?", (url,)
+    ):
+        return etag, last_modified
+
+    return None, None
+
+
+def store_validators(db, url, response):
+    """Record the ETag and Last-Modified headers of the response for the url."""
+
+    db.execute(
+        "REPLACE into http_cache values(?, ?, ?)",
+        (url, response.headers.get("ETag"), response.headers.get("Last-Modified")),
+    )
+
+
+def conditional_get(db, url, stream=False):
+    """
+    Retrieve the url, unless it hasn't changed since the last retrieval.
+
+    The ETag and Last-Modified headers of each response are kept in the http_cache
+    table and sent with the next request for that url. Returns None if the server
+    responds that the resource is unchanged.
+
+    """
+
+    response = get_if_modified(url, *load_validators(db, url), stream=stream)
+
+    if response is not None:
+        store_validators(db, url, response)
+
+    return response
+
+
+def conditional_get_all(db, urls, workers=4, conditional=True):
+    """
+    Retrieve all of the urls concurrently, yielding (url, response) in order.
+
+    At most 4 requests are started every 15 seconds, including requests from earlier
+    calls, see wait_for_request_slot. Responses are yielded back on the calling
+    thread so all database access stays on a single thread. As for conditional_get, the
+    response is None if the resource hasn't changed since the last retrieval.
+
+    If conditional is False the stored validators aren't sent, so every url is
+    retrieved again in full.
+
+    """
+
+    validators = {
+        url: load_validators(db, url) if conditional else (None, None) for url in urls
+    }
+
+    def fetch(url):
+        wait_for_request_slot()
+        return get_if_modified(url, *validators[url])
+
+    pool = cf.ThreadPoolExecutor(workers)
+
+    try:
+        for url, response in zip(urls, pool.map(fetch, urls)):
+            if response is not None:
+                store_validators(db, url, response)
+
+            yield url, response
+
+    finally:
+        pool.shutdown(cancel_futures=True)
+
+
+def bulk_replace(db, table, columns, rows, chunk=500):
+    """
+    Replace rows into a table using multi-row VALUES statements.
+
+    Each statement binds up to `chunk` rows, limited to keep the number of parameters
+    within SQLite's default maximum of 999.
+
+    """
+
+    chunk = min(999 // len(columns), chunk)
+    placeholders = "(" + ", ".join("?" * len(columns)) + ")"
+    statement = f"REPLACE into {table} ({', '.join(columns)}) values "
+
+    for start in range(0, len(rows), chunk):
+        batch = rows[start : start + chunk]
+
+        db.execute(
+            statement + ", ".join([placeholders] * len(batch)),
+            list(itertools.chain.from_iterable(batch)),
+        )
+
 
 def retrieve_parliamentarians(db):
 
@@ -25,11 +203,11 @@ def retrieve_parliamentarians(db):
         "&$select=PHID,DisplayName,gender,dateOfBirth,dateOfDeath"
     )
 
-    response = requests.get(handbook_api)
+    response = conditional_get(db, handbook_api, stream=True)
 
-    response.raise_for_status()
-
-    parliamentarians = response.json()["value"]
+    if response is None:
+        print("Parliamentarians unchanged.")
+        return
 
     db.execute("DROP table if exists parliamentarian")
     db.execute("""
@@ -42,13 +220,15 @@ def retrieve_parliamentarians(db):
         )
         """)
 
-    db.executemany(
+    insert_json_items(
+        db,
+        response,
+        "value.item",
         """
         INSERT into parliamentarian values 
             (:PHID, :DisplayName, :Gender, :DateOfBirth, :DateOfDeath)
 
         """,
-        parliamentarians,
     )
 
 
@@ -61,21 +241,21 @@ def retrieve_party_records(db):
     iterate through them to get a complete record of the history for each
     parliamentarian.
 
+    Only parties whose records have changed since the last run are updated.
+
     """
 
-    db.execute("DROP table if exists party")
     db.execute(
         """
-        CREATE table party (
+        CREATE table if not exists party (
             party_id integer primary key,
             name text
         )
         """,
     )
-    db.execute("DROP table if exists party_member")
     db.execute(
         """
-        CREATE table party_member (
+        CREATE table if not exists party_member (
             party_id integer references party,
             phid references parliamentarian,
             start_date,
@@ -85,49 +265,55 @@ def retrieve_party_records(db):
         """,
     )
 
-    all_parties = requests.get("https://handbookapi.aph.gov.au/api/partiesdata/parties")
-
-    all_parties.raise_for_status()
-
-    parties = all_parties.json()
+    all_parties = conditional_get(
+        db, "https://handbookapi.aph.gov.au/api/partiesdata/parties", stream=True
+    )
 
-    db.executemany("INSERT into party values (:PartyID, :PrimaryName)", parties)
+    if all_parties is not None:
+        db.execute("DELETE from party")
+        insert_json_items(
+            db,
+            all_parties,
+            "item",
+            "INSERT into party values (:PartyID, :PrimaryName)",
+        )
+        # Drop membership records for parties that are no longer listed.
+        db.execute(
+            "DELETE from party_member where party_id not in (SELECT party_id from party)"
+        )
 
-    detailed_url = "https://handbookapi.aph.gov.au/api/partiesdata/partydetailed"
-    for i, party in enumerate(parties):
+    parties = list(db.execute("SELECT party_id, name from party order by party_id"))
 
-        party_id = party["PartyID"]
+    detailed_url = (
+        "https://handbookapi.aph.gov.au/api/partiesdata/partydetailed?partyID={}"
+    )
+    party_urls = [detailed_url.format(party_id) for party_id, _ in parties]
 
-        print(f"Retrieving party {i+1}/{len(parties)}:", party["PrimaryName"])
+    for i, ((party_id, party_name), (_, party_detailed)) in enumerate(
+        zip(parties, conditional_get_all(db, party_urls))
+    ):
 
-        data = {"partyID": party_id}
+        print(f"Retrieved party {i+1}/{len(parties)}:", party_name)
 
-        party_detailed = requests.get(detailed_url, params=data)
+        if party_detailed is None:
+            continue
 
-        party_detailed.raise_for_status()
+        db.execute("DELETE from party_member where party_id = ?", (party_id,))
 
         party_members = party_detailed.json()["PartyMembers"]
 
-        for member in party_members:
-            row_header = {"party_id": party_id, "phid": member["PHID"]}
-
-            # A person can have multiple records in a party, representing: losing and
-            # regaining their seat, leaving/joining a party, changing from the house to
-            # the senate etc.
-
-            party_records = member["PartyRecords"]
-
-            db.executemany(
-                """
-                INSERT into party_member values(:party_id, :phid, :StartDate, :EndDate)
-                """,
-                (
-                    dict(**row_header, **member_record)
-                    for member_record in party_records
-                ),
-            )
-
-        time.sleep(15)
+        # A person can have multiple records in a party, representing: losing and
+        # regaining their seat, leaving/joining a party, changing from the house to
+        # the senate etc.
+        rows = [
+            (party_id, member["PHID"], r["StartDate"], r["EndDate"])
+            for member in party_members
+            for r in member["PartyRecords"]
+        ]
+
+        bulk_replace(
+            db, "party_member", ("party_id", "phid", "start_date", "end_date"), rows
+        )
 
 
 def retrieve_ministries(db):
@@ -138,12 +324,14 @@ def retrieve_ministries(db):
     as they're recorded as discrete events, and who is assigned at the time of each
     ministry.
 
+    The ministers are only rebuilt if the list of ministries or any ministry's records
+    have changed since the last run.
+
     """
 
-    db.execute("DROP table if exists ministry")
     db.execute(
         """
-        CREATE table ministry (
+        CREATE table if not exists ministry (
             ministry_id integer primary key,
             name,
             start_date date,
@@ -151,10 +339,9 @@ def retrieve_ministries(db):
         )
         """,
     )
-    db.execute("DROP table if exists minister")
     db.execute(
         """
-        CREATE table minister (
+        CREATE table if not exists minister (
             phid,
             role,
             preposition,
@@ -166,31 +353,67 @@ def retrieve_ministries(db):
         """,
     )
 
-    all_ministries = requests.get(
-        "https://handbookapi.aph.gov.au/api/StatisticalInformation/Ministries"
+    all_ministries = conditional_get(
+        db,
+        "https://handbookapi.aph.gov.au/api/StatisticalInformation/Ministries",
+        stream=True,
     )
 
-    all_ministries.raise_for_status()
-
-    ministries = all_ministries.json()
+    if all_ministries is not None:
+        db.execute("DELETE from ministry")
+        insert_json_items(
+            db,
+            all_ministries,
+            "item",
+            "INSERT into ministry values (:Id, :MinistryName, :DateStart, :DateEnd)",
+        )
 
-    db.executemany(
-        "INSERT into ministry values (:Id, :MinistryName, :DateStart, :DateEnd)",
-        ministries,
+    ministries = list(
+        db.execute("SELECT ministry_id, name from ministry order by ministry_id")
     )
 
     detailed_url = (
         "https://handbookapi.aph.gov.au/api/ministryrecords?$filter=MID%20eq%20{}"
     )
-    for i, ministry in enumerate(ministries):
+    ministry_urls = [detailed_url.format(ministry_id) for ministry_id, _ in ministries]
+
+    # If the list of ministries has changed everything is rebuilt below, so there's no
+    # point sending the validators.
+    responses = []
 
-        ministry_id = ministry["Id"]
+    for i, ((_, ministry_name), (_, ministry_detailed)) in enumerate(
+        zip(
+            ministries,
+            conditional_get_all(db, ministry_urls, conditional=all_ministries is None),
+        )
+    ):
+        print(f"Retrieved ministry {i+1}/{len(ministries)}:", ministry_name)
+        responses.append(ministry_detailed)
 
-        print(f"Retrieving ministry {i+1}/{len(ministries)}:", ministry["MinistryName"])
+    if all_ministries is None and all(response is None for response in responses):
+        print("Ministries unchanged.")
+        return
 
-        ministry_detailed = requests.get(detailed_url.format(ministry_id))
+    # Minister records are shared between ministries, as the records for each member
+    # in a ministry also include consecutive service from earlier ministries. A change
+    # to any ministry can't be applied on its own, so the table is rebuilt from every
+    # ministry in order, retrieving the unchanged ones again.
+    unchanged_urls = [
+        url for url, response in zip(ministry_urls, responses) if response is None
+    ]
 
-        ministry_detailed.raise_for_status()
+    if unchanged_urls:
+        print(f"Retrieving {len(unchanged_urls)} unchanged ministries to reapply.")
+        retrieved = dict(conditional_get_all(db, unchanged_urls, conditional=False))
+
+        responses = [
+            retrieved[url] if response is None else response
+            for url, response in zip(ministry_urls, responses)
+        ]
+
+    db.execute("DELETE from minister")
+
+    for ministry_detailed in responses:
 
         ministry_roles = ministry_detailed.json()["value"]
 
@@ -198,18 +421,22 @@ def retrieve_ministries(db):
             if m["RDateEnd"] == "":
                 m["RDateEnd"] = None
 
-        # Note that this is replace into, because the records for each member in
-        # a ministry also include consecutive service from an earlier ministry.
+        # Note that this is an upsert, because the records for each member in a
+        # ministry also include consecutive service from an earlier ministry.
         db.executemany(
             """
-            REPLACE into minister 
+            INSERT into minister 
                 values(:PHID, :Role, :Prep, :Entity, :RDateStart, :RDateEnd)
+            on conflict(phid, start_date, role, entity) do update
+                set 
+                    preposition = excluded.preposition,
+                    end_date = excluded.end_date
+                where minister.preposition is not excluded.preposition
+                    or minister.end_date is not excluded.end_date
             """,
             ministry_roles,
         )
 
-        time.sleep(15)
-
 
 def retrieve_electorates(db):
     """Retrieve electorate information from the Parliamentary Handbook."""
@@ -229,6 +456,27 @@ if __name__ == "__main__":
 
     db = sqlite3.connect("oz_federal_hansard.db", isolation_level=None)
 
+    # Settings for bulk loading - avoid waiting on fsyncs and keep more pages in memory.
+    db.executescript("""
+        pragma journal_mode=WAL;
+        pragma synchronous=NORMAL;
+        pragma temp_store=MEMORY;
+        pragma cache_size=-65536;
+        pragma mmap_size=268435456;
+        """)
+
+    db.execute("""
+        CREATE table if not exists http_cache (
+            url text primary key,
+            etag text,
+            last_modified text
+        )
+        """)
+
+    # Discard the cached validators so that everything is retrieved again.
+    if "--full-refresh" in args:
+        db.execute("DELETE from http_cache")
+
     db.execute("begin")
     # Update info from the parliamentary handbook
     # retrieve_electorates(db)
@@ -236,4 +484,9 @@ if __name__ == "__main__":
     retrieve_party_records(db)
     retrieve_ministries(db)
 
+    # Indexes for linking to speakers - these are created after loading so they're
+    # built in one pass instead of being maintained for every inserted row.
+    db.execute("CREATE index if not exists party_member_phid on party_member(phid)")
+    db.execute("CREATE index if not exists minister_phid on minister(phid)")
+
     db.execute("commit")
@@ -33,60 +33,184 @@ The sync follows this process:
 # /// script
 # requires-python = ">=3.12"
 # dependencies = [
+#   "aiohttp",
+#   "requests",
 #   "selenium",
+#   "zstandard",
 # ]
 # ///
 
+import asyncio
+import codecs
 import collections
+import concurrent.futures as cf
+import contextlib
 import datetime
+import io
+import itertools
 import os
+import re
 import sqlite3
-import tempfile
+import threading
 import time
 import traceback
 import xml.etree.ElementTree as ET
 
-from urllib.parse import urlparse, parse_qs
+import aiohttp
+import requests
+import zstandard as zstd
 
 from selenium import webdriver
-from selenium.common.exceptions import TimeoutException
-from selenium.webdriver.common.by import By
+
+# Extract the page number from the query id in a Hansard URL - this is the last path
+# component of the (URL encoded) quoted id, for example 0000 in:
+#   query=Id%3A%22chamber%2Fhansards%2F2004-02-10%2F0000%22
+query_page_number = re.compile(
+    r";query=[^;]*?%22(?:[^;]*?%2F)?([^;%]*)%22", re.IGNORECASE
+)
 
 
 def timestamp_now():
     return datetime.datetime.now(datetime.UTC).isoformat()
 
 
-def extract_sitemap_components(sitemap_xml_str):
+def extract_sitemap_components(sitemap_xml):
     """
     Extract the URL and lastmod dates for the sitemap.
 
+    The sitemap is parsed incrementally from the raw bytes, and each url element is
+    discarded once it's been processed rather than building the whole tree.
+
     """
-    tree = ET.fromstring(sitemap_xml_str)
 
-    for url in tree.iter("{http://www.sitemaps.org/schemas/sitemap/0.9}url"):
+    for _, url in ET.iterparse(io.BytesIO(sitemap_xml), events=("end",)):
+        if url.tag != "{http://www.sitemaps.org/schemas/sitemap/0.9}url":
+            continue
+
         loc = url.find("{http://www.sitemaps.org/schemas/sitemap/0.9}loc").text
         lastmod = url.find("{http://www.sitemaps.org/schemas/sitemap/0.9}lastmod").text
 
+        url.clear()
+
         yield (loc, lastmod)
 
 
-def init_and_refresh_sitemap(driver, db):
+async def fetch_sitemaps(urls, rate=1 / 15, concurrency=8, etags=None):
+    """
+    Retrieve the given sitemap urls, yielding (url, etag, xml) in the order given.
+
+    If an etag from a previous retrieval is provided for a url in `etags` it's sent as
+    a conditional request - if the server reports the sitemap as unchanged the xml is
+    None.
+
+    Requests are started no more often than `rate` per second, but up to `concurrency`
+    requests can be in flight at once so that slow responses overlap with the wait
+    before the next request, rather than adding to it.
+
+    """
+
+    interval = 1 / rate
+    etags = etags or {}
+    next_start = 0
+    start_lock = asyncio.Lock()
+
+    async def fetch(session, url):
+        nonlocal next_start
+
+        # Space out the start of each request to keep the aggregate rate polite.
+        async with start_lock:
+            await asyncio.sleep(max(0, next_start - time.monotonic()))
+            next_start = time.monotonic() + interval
+
+        headers = {}
+        if etag := etags.get(url):
+            headers["If-None-Match"] = etag
+
+        async with session.get(url, headers=headers) as response:
+            if response.status == 304:
+                return url, etag, None
+
+            response.raise_for_status()
+            return url, response.headers.get("ETag"), await response.read()
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+
+    async with aiohttp.ClientSession(connector=connector) as session:
+        urls = iter(urls)
+        in_flight = collections.deque(
+            asyncio.ensure_future(fetch(session, url))
+            for url in itertools.islice(urls, concurrency)
+        )
+
+        try:
+            while in_flight:
+                result = await in_flight.popleft()
+
+                # Keep the window full - the next request is scheduled before the
+                # caller processes this result.
+                for url in itertools.islice(urls, 1):
+                    in_flight.append(asyncio.ensure_future(fetch(session, url)))
+
+                yield result
+
+        finally:
+            # The caller may stop early, so cancel anything that is still pending.
+            for task in in_flight:
+                task.cancel()
+
+
+def bulk_replace(db, table, columns, rows, chunk=500):
+    """
+    Replace rows into a table using multi-row VALUES statements.
+
+    Each statement binds up to `chunk` rows, limited to keep the number of parameters
+    within SQLite's default maximum of 999.
+
+    """
+
+    chunk = min(999 // len(columns), chunk)
+    placeholders = "(" + ", ".join("?" * len(columns)) + ")"
+    statement = f"REPLACE into {table} ({', '.join(columns)}) values "
+
+    for start in range(0, len(rows), chunk):
+        batch = rows[start : start + chunk]
+
+        db.execute(
+            statement + ", ".join([placeholders] * len(batch)),
+            list(itertools.chain.from_iterable(batch)),
+        )
+
+
+def store_sitemap_etag(db, source_sitemap, etag):
+    """Record the ETag of a retrieved sitemap component for conditional requests."""
+
+    if etag is None:
+        db.execute(
+            "DELETE from process_data where key = ?", ("etag:" + source_sitemap,)
+        )
+    else:
+        db.execute(
+            "REPLACE into process_data values(?, ?)", ("etag:" + source_sitemap, etag)
+        )
+
+
+async def init_and_refresh_sitemap(db):
     """
     Initialise and update the local sitemap with a copy of the aph sitemap.
 
     Will interruptibly retrieve and refresh all sitemap parts until the sitemap is fully
     populated.
 
+    The sitemap is plain XML, so it's retrieved directly over HTTP rather than through
+    the browser.
+
     """
 
     sitemap_entry_url = "https://parlinfo.aph.gov.au/sitemap/sitemapindex.xml"
 
-    # Visit sitemap - we'll use Selenium DOM to work with the XML, rather than
-    # trying to do it directly....
-    driver.get(sitemap_entry_url)
-
-    tree = ET.fromstring(driver.page_source)
+    async with contextlib.aclosing(fetch_sitemaps([sitemap_entry_url])) as index:
+        async for _, _, sitemap_index in index:
+            tree = ET.fromstring(sitemap_index)
 
     # Sitemaps that exist
     sitemaps = [
@@ -122,24 +246,30 @@ def init_and_refresh_sitemap(driver, db):
         raise ValueError("Unexpectedly small sitemap components found - exiting")
 
     # Make sure we've retrieved all sitemap components.
-    for i, source_sitemap in enumerate(reversed(sitemaps)):
+    to_retrieve = [
+        source_sitemap
+        for source_sitemap in reversed(sitemaps)
+        if source_sitemap not in previously_retrieved
+    ]
 
-        if source_sitemap in previously_retrieved:
-            continue
+    async with contextlib.aclosing(fetch_sitemaps(to_retrieve)) as retrieved:
+        i = 0
+        async for source_sitemap, etag, sitemap_xml in retrieved:
+            i += 1
+            print(i, "/", len(to_retrieve), source_sitemap)
 
-        print(i + 1, "/", len(sitemaps), source_sitemap)
+            rows = [
+                (loc, source_sitemap, lastmod)
+                for loc, lastmod in extract_sitemap_components(sitemap_xml)
+            ]
 
-        db.execute("begin")
+            db.execute("begin")
 
-        driver.get(source_sitemap)
+            bulk_replace(db, "sitemap", ("url", "source_sitemap", "lastmod"), rows)
 
-        for loc, lastmod in extract_sitemap_components(driver.page_source):
-            db.execute(
-                "REPLACE into sitemap values(?, ?, ?)", [loc, source_sitemap, lastmod]
-            )
-        db.execute("commit")
+            store_sitemap_etag(db, source_sitemap, etag)
 
-        time.sleep(15)
+            db.execute("commit")
 
     print("Sitemap initialised.")
 
@@ -159,28 +289,44 @@ def init_and_refresh_sitemap(driver, db):
 
     print(f"Refreshing sitemap until {reference_date}.")
 
+    # ETags from the last retrieval of each sitemap component, so unchanged components
+    # don't need to be downloaded again.
+    etags = {
+        key.removeprefix("etag:"): value
+        for key, value in db.execute(
+            "SELECT key, value from process_data where key like 'etag:%'"
+        )
+    }
+
     # Now ensure we have an up to date copy of the sitemap, taking advantage of the fact
     # that the urls are provided in order of last modification date.
-    for i, source_sitemap in enumerate(reversed(sitemaps)):
-        db.execute("begin")
+    async with contextlib.aclosing(
+        fetch_sitemaps(reversed(sitemaps), etags=etags)
+    ) as retrieved:
+        async for source_sitemap, etag, sitemap_xml in retrieved:
+
+            # An unchanged component means that all of the older components are also
+            # unchanged, so we're up to date.
+            if sitemap_xml is None:
+                break
 
-        driver.get(source_sitemap)
+            rows = [
+                (loc, source_sitemap, lastmod)
+                for loc, lastmod in extract_sitemap_components(sitemap_xml)
+            ]
 
-        max_lastmod = ""
+            max_lastmod = max((lastmod for _, _, lastmod in rows), default="")
 
-        for loc, lastmod in extract_sitemap_components(driver.page_source):
-            db.execute(
-                "REPLACE into sitemap values(?, ?, ?)", [loc, source_sitemap, lastmod]
-            )
+            db.execute("begin")
 
-            max_lastmod = max(lastmod, max_lastmod)
+            bulk_replace(db, "sitemap", ("url", "source_sitemap", "lastmod"), rows)
 
-        db.execute("commit")
+            store_sitemap_etag(db, source_sitemap, etag)
 
-        if max_lastmod <= reference_date:
-            break
+            db.execute("commit")
 
-        time.sleep(15)
+            if max_lastmod <= reference_date:
+                break
 
     now = timestamp_now()
     db.execute("REPLACE into process_data values(?, ?)", ("last_refresh_time", now))
@@ -190,16 +336,22 @@ def identify_transcripts_to_retrieve(db):
     """
     Process the sitemap to identify Hansard transcripts that exist for retrieval.
 
+    Only first pages that are new, or have changed since they were last identified,
+    are considered - most of the sitemap is unchanged from run to run.
+
     """
 
     db.execute("begin")
-    possible_transcripts = db.execute("""
-        SELECT url, lastmod
-        from sitemap
-        where instr(url, 'hansard')
+    possible_transcripts = db.execute(r"""
+        SELECT s.url, s.lastmod
+        from sitemap s
+        left outer join hansard_transcript h on s.url = h.url
+        where instr(s.url, 'hansard')
+            and s.url like '%\%2F0000\%22%' escape '\'
+            and (h.url is null or h.lastmod is not s.lastmod)
         """)
 
-    pages = collections.Counter()
+    first_pages = []
 
     # Parse the URLs in the sitemap - to identify sitting days.
     # One daily transcript becomes multiple speeches bundled together with a pagination
@@ -210,32 +362,257 @@ def identify_transcripts_to_retrieve(db):
         # Parse the query to find the first page of each day - this is page 0000. Each
         # sitting day is split across multiple HTML pages, approximately one per
         # speech. Note that we're also filtering out some nonsensical URLs that appear
-        # to correspond to data entry issues.
-        url_params = urlparse(url).params
-        query_id = parse_qs(url_params)["query"][0].split('"')[1]
-
-        query_id_components = query_id.split("/")
-        page_no = query_id_components[-1]
-        pages[page_no] += 1
+        # to correspond to data entry issues. The query above is only a coarse filter
+        # for these, this checks the page number is the last component of the id.
+        page_no = query_page_number.search(url).group(1)
 
         if page_no == "0000":
-            # This is an upsert - we mark it as an ancient retrieved date to always
-            # mark new items as ready for retrieval.
-            db.execute(
-                "INSERT or ignore into hansard_transcript(url, retrieved) values(?, ?)",
-                (url, "2000-01-01"),
-            )
-            db.execute(
-                "UPDATE hansard_transcript set lastmod = ?2 where url = ?1",
-                (url, lastmod),
-            )
-
-    print("Top 10 most common page numbers:", pages.most_common(10))
+            first_pages.append((url, lastmod))
+
+    # This is an upsert - we mark it as an ancient retrieved date to always mark new
+    # items as ready for retrieval.
+    db.executemany(
+        "INSERT or ignore into hansard_transcript(url, retrieved) values(?, ?)",
+        [(url, "2000-01-01") for url, _ in first_pages],
+    )
+    db.executemany(
+        "UPDATE hansard_transcript set lastmod = ?2 where url = ?1", first_pages
+    )
+
+    print("New or updated transcripts found:", len(first_pages))
 
     db.execute("commit")
 
 
-def retrieve_transcripts(driver, db, download_dir):
+def compress_text(compressor, text):
+    """Compress text as UTF-8 with the given zstd compressor, passing through None."""
+
+    if text is None:
+        return None
+
+    return compressor.compress(text.encode("utf-8"))
+
+
+# The encoding named in the XML declaration at the start of a transcript, if any.
+xml_declared_encoding = re.compile(
+    rb"""(?:\xef\xbb\xbf)?\s*<\?xml[^>]*?encoding\s*=\s*["']([A-Za-z0-9._-]+)["']"""
+)
+
+
+def transcript_to_utf8(content):
+    """
+    Return the raw bytes of a transcript encoded as UTF-8, for storage.
+
+    XML transcripts are decoded with the encoding in their XML declaration, defaulting
+    to UTF-8. SGML transcripts have no declaration, so they're taken as UTF-8, falling
+    back to Windows-1252 for any that aren't valid UTF-8. Transcripts that are already
+    UTF-8 are returned unchanged.
+
+    """
+
+    declared = xml_declared_encoding.match(content)
+    encoding = declared[1].decode("ascii") if declared else "utf-8"
+
+    try:
+        text = content.decode(encoding)
+    except (LookupError, UnicodeDecodeError):
+        text = content.decode("windows-1252", errors="replace")
+    else:
+        if codecs.lookup(encoding).name == "utf-8":
+            return content
+
+    return text.encode("utf-8")
+
+
+def compress_stored_pages(db):
+    """
+    Migrate HTML pages and transcripts stored uncompressed to the compressed columns.
+
+    Earlier versions stored the retrieved pages as plain text - this only needs to do
+    any work once for an existing database.
+
+    """
+
+    compressor = zstd.ZstdCompressor(level=3)
+
+    to_compress = [r[0] for r in db.execute("""
+            SELECT url 
+            from hansard_transcript 
+            where html_ref_page is not null 
+                or transcript_markup is not null
+            """)]
+
+    for i, url in enumerate(to_compress):
+        if i % 500 == 0:
+            print("Compressing stored pages", i, "/", len(to_compress))
+            db.execute("begin")
+
+        html_page, transcript_markup = db.execute(
+            """
+            SELECT html_ref_page, transcript_markup 
+            from hansard_transcript 
+            where url = ?
+            """,
+            (url,),
+        ).fetchone()
+
+        db.execute(
+            """
+            UPDATE hansard_transcript
+                set
+                    html_ref_page = null,
+                    transcript_markup = null,
+                    html_ref_page_zstd = ?,
+                    transcript_markup_zstd = ?
+                where url = ?
+            """,
+            (
+                compress_text(compressor, html_page),
+                compress_text(compressor, transcript_markup),
+                url,
+            ),
+        )
+
+        if i % 500 == 499 or i == len(to_compress) - 1:
+            db.execute("commit")
+
+
+# Collect the transcript links and the metadata labels and values from a parlinfo page.
+# Note that this uses textContent, so unlike Selenium's element text it includes the
+# metadata hidden by the page's toggle by default.
+page_details_script = """
+    const labels = document.querySelectorAll(".mdLabel");
+    const values = document.querySelectorAll(".mdValue");
+    const metadata = {};
+
+    labels.forEach((label, i) => {
+        const value = i < values.length ? values[i].textContent.trim() : "";
+        if (value) {
+            metadata[label.textContent.trim()] = value;
+        }
+    });
+
+    const hrefs = (selector) => [...document.querySelectorAll(selector)].map(
+        (a) => a.href
+    );
+
+    return {
+        pdf_links: hrefs("a[href*='toc_pdf']"),
+        xml_links: hrefs("a[href*='toc_unixml']"),
+        metadata: metadata,
+        user_agent: navigator.userAgent,
+    };
+"""
+
+
+def retrieve_transcript(driver, session, url):
+    """
+    Retrieve the HTML page and transcript for the sitting day at url.
+
+    The page is loaded in the browser, and the transcript downloaded with the requests
+    session.
+
+    Returns the details to record for the transcript.
+
+    """
+
+    driver.get(url)
+
+    html_page = driver.page_source
+
+    # Everything needed from the page is collected in one script, rather than a
+    # WebDriver request for every element and attribute.
+    page_details = driver.execute_script(page_details_script)
+
+    transcript_link = None
+    transcript_type = None
+    pdf_link = None
+
+    pdf_links = page_details["pdf_links"]
+    xml_links = page_details["xml_links"]
+
+    assert len(pdf_links) <= 1
+    # There are a few cases that don't have PDF transcripts that need
+    # investigating
+    pdf_link = None
+    if pdf_links:
+        pdf_link = pdf_links[0]
+
+    assert len(xml_links) <= 1
+
+    if xml_links:
+        transcript_link = xml_links[0]
+        transcript_type = "xml"
+
+    # Generate the SGML link if no XML link is present. This is a bit of magic
+    # from knowing the internals provided by Parl Library staff. We could just
+    # use a fixed set of URLs for this component, but it seems better to be
+    # aware of and respond to updates.
+    if transcript_link is None:
+
+        mapping = page_details["metadata"]
+
+        system_id_components = mapping["System Id"].split("/")
+        transcript_id = "/".join(system_id_components[:-1])
+        date = system_id_components[2]
+
+        if system_id_components[1] == "hansardr":
+            house = "reps"
+        elif system_id_components[1] == "hansards":
+            house = "senate"
+
+        transcript_type = "sgml"
+
+        transcript_url_file = f"{house}%20{date}.sgm"
+        transcript_link = (
+            "https://parlinfo.aph.gov.au/parlInfo/download/"
+            f"{transcript_id}/toc_sgml/{transcript_url_file}"
+        )
+
+    # The transcript itself is just a file download, so there's no need for the
+    # browser. Having loaded the HTML page, the browser has dealt with the JS for
+    # their WAF configuration, so the session can reuse its cookies to download the
+    # transcript directly. This also avoids the funky mix of content types for some
+    # of the SGML transcripts, which firefox handles inconsistently.
+    for cookie in driver.get_cookies():
+        session.cookies.set(
+            cookie["name"],
+            cookie["value"],
+            domain=cookie.get("domain", ""),
+            path=cookie.get("path", "/"),
+        )
+
+    session.headers["User-Agent"] = page_details["user_agent"]
+
+    response = session.get(transcript_link, timeout=15)
+
+    response.raise_for_status()
+
+    # Check for an HTML error or WAF challenge page rather than a transcript, and fail
+    # the retrieval so it's tried again on the next run instead of storing the page.
+    # This goes by the content rather than the Content-Type, as some of the SGML
+    # transcripts are served with a mix of content types.
+    content_start = (
+        response.content[:1024].removeprefix(codecs.BOM_UTF8).lstrip()[:15].lower()
+    )
+
+    if content_start.startswith((b"<!doctype html", b"<html")):
+        raise ValueError(f"Couldn't retrieve a transcript at {transcript_link}")
+
+    # Decode the transcript explicitly rather than with response.text - requests
+    # falls back to ISO-8859-1 for text/* content types without a charset.
+    transcript_markup = transcript_to_utf8(response.content)
+
+    return {
+        "html": html_page,
+        "pdf_link": pdf_link,
+        "transcript_url": transcript_link,
+        "markup_type": transcript_type,
+        "transcript_markup": transcript_markup,
+    }
+
+
+def retrieve_transcripts(drivers, db):
     """
     Retrieve outdated transcripts.
 
@@ -246,6 +623,13 @@ def retrieve_transcripts(driver, db, download_dir):
     necessary structural evaluation by examining the navigation elements to smaller
     units of text.
 
+    The transcripts are shared out between the drivers, each retrieving from its own
+    share in a separate thread at the usual slow pace. The database connection is
+    shared between the threads, so writes are serialised with a lock.
+
+    The HTML page and transcript are stored zstd compressed, as they're large and
+    compress well.
+
     """
 
     to_retrieve = list(r[0] for r in db.execute("""
@@ -257,14 +641,28 @@ def retrieve_transcripts(driver, db, download_dir):
 
     total_to_retrieve = len(to_retrieve)
 
-    last_loop_start = 0
+    db_lock = threading.Lock()
+    retrieval_count = itertools.count()
     failures = 0
 
-    for i, url in enumerate(to_retrieve):
-        print("Retrieving", i, "/", total_to_retrieve, url)
+    def retrieve_share(driver, urls):
+        nonlocal failures
+
+        last_loop_start = 0
+
+        # Compressors can't be shared between threads.
+        compressor = zstd.ZstdCompressor(level=3)
+        session = requests.Session()
+
+        for url in urls:
+
+            # If multiple failures happen just exit - there might be a problem with the
+            # retrieval method, or just an outage within parlinfo.
+            if failures >= 10:
+                break
+
+            print("Retrieving", next(retrieval_count), "/", total_to_retrieve, url)
 
-        # Handle failures by moving on - we'll try them again on the next run.
-        try:
             now = timestamp_now()
             current_timestamp = time.monotonic()
 
@@ -274,157 +672,84 @@ def retrieve_transcripts(driver, db, download_dir):
             time.sleep(max(0, sleep_time))
             last_loop_start = time.monotonic()
 
-            db.execute("begin")
-
-            driver.get(url)
-
-            html_page = driver.page_source
-
-            links = [
-                l.get_attribute("href") or ""
-                for l in driver.find_elements(By.TAG_NAME, "a")
-            ]
-
-            transcript_link = None
-            transcript_type = None
-            pdf_link = None
-
-            pdf_links = [l for l in links if "toc_pdf" in l]
-            xml_links = [l for l in links if "toc_unixml" in l]
-
-            assert len(pdf_links) <= 1
-            # There are a few cases that don't have PDF transcripts that need
-            # investigating
-            pdf_link = None
-            if pdf_links:
-                pdf_link = pdf_links[0]
-
-            assert len(xml_links) <= 1
-
-            if xml_links:
-                transcript_link = xml_links[0]
-                transcript_type = "xml"
-
-            # Generate the SGML link if no XML link is present. This is a bit of magic
-            # from knowing the internals provided by Parl Library staff. We could just
-            # use a fixed set of URLs for this component, but it seems better to be
-            # aware of and respond to updates.
-            if transcript_link is None:
+            # Handle failures by moving on - we'll try them again on the next run.
+            try:
+                transcript = retrieve_transcript(driver, session, url)
 
-                # Selenium only shows visible elements - there's a JS toggle that hides
-                # most of the metadata by default
-                check_input = driver.find_element(By.ID, "toggleMetadata")
+            except Exception:
+                print(traceback.format_exc())
+                print(
+                    f"Uncaught exception for {url} - transcript not retrieved, "
+                    "continuing"
+                )
 
-                if check_input.get_attribute("alt") == "Expand":
-                    check_input.click()
+                with db_lock:
+                    failures += 1
 
-                keys = driver.find_elements(By.CLASS_NAME, "mdLabel")
-                values = driver.find_elements(By.CLASS_NAME, "mdValue")
+                continue
 
-                mapping = {}
+            html_zstd = compress_text(compressor, transcript.pop("html"))
+
+            # The transcript is already UTF-8 bytes, so it's compressed as is.
+            markup_zstd = compressor.compress(transcript.pop("transcript_markup"))
+
+            with db_lock:
+                db.execute(
+                    """
+                    UPDATE hansard_transcript
+                        set 
+                            retrieved = :retrieved,
+                            html_ref_page = null,
+                            html_ref_page_zstd = :html_zstd,
+                            transcript_pdf_url = :pdf_link,
+                            transcript_markup_url = :transcript_url,
+                            transcript_markup_type = :markup_type,
+                            transcript_markup = null,
+                            transcript_markup_zstd = :markup_zstd
+                        where url = :url
+                    """,
+                    {
+                        "retrieved": now,
+                        "url": url,
+                        "html_zstd": html_zstd,
+                        "markup_zstd": markup_zstd,
+                        **transcript,
+                    },
+                )
 
-                for key, value in zip(keys, values):
-                    if value.text.strip():
-                        mapping[key.text.strip()] = value.text
+    # Round robin the transcripts between drivers so they all progress through the
+    # oldest changes first.
+    with cf.ThreadPoolExecutor(len(drivers)) as pool:
+        shares = [
+            pool.submit(retrieve_share, driver, to_retrieve[i :: len(drivers)])
+            for i, driver in enumerate(drivers)
+        ]
 
-                system_id_components = mapping["System Id"].split("/")
-                transcript_id = "/".join(system_id_components[:-1])
-                date = system_id_components[2]
+        for share in shares:
+            share.result()
 
-                if system_id_components[1] == "hansardr":
-                    house = "reps"
-                elif system_id_components[1] == "hansards":
-                    house = "senate"
 
-                transcript_type = "sgml"
+def start_driver():
+    """Start a Firefox instance for retrieving transcripts."""
 
-                transcript_url_file = f"{house}%20{date}.sgm"
-                transcript_path = f"{house} {date}.sgm"
-                transcript_link = (
-                    "https://parlinfo.aph.gov.au/parlInfo/download/"
-                    f"{transcript_id}/toc_sgml/{transcript_url_file}"
-                )
+    options = webdriver.FirefoxOptions()
 
-            # There's some funky mix of content types for a few of the SGML transcripts,
-            # so prepare to handle the edge cases. This would be simpler if we were
-            # just using a library like requests, but then we'd need to juggle cookies
-            # and JS for their WAF configuration.
-            try:
-                driver.get(transcript_link)
-                transcript_markup = driver.page_source
-
-            except TimeoutException:
-                # Check the download temp directory and use that file if present,
-                # otherwise continue without marking this as retrieved.
-
-                if transcript_type == "sgml":
-                    download_path = os.path.join(download_dir, transcript_path)
-
-                    if os.path.exists(download_path):
-                        with open(download_path, "r") as f:
-                            transcript_markup = f.read()
-                    else:
-                        print(f"Failed to retrieve SGML transcript {transcript_link}")
-                        raise
-                else:
-                    raise
-
-            if transcript_markup.startswith("<html"):
-                # Handle case for SGML with type application/plain get's wrapped in a
-                # basic pre tag by firefox for display, which is the "page source"
-                # according to the firefox/selenium combo.
-                transcript_markup = None
-
-                if transcript_type == "sgml":
-                    pres = driver.find_elements(By.CSS_SELECTOR, "html > body > pre")
-
-                    if len(pres) == 1:
-                        transcript_markup = pres[0].text
-
-                if transcript_markup is None:
-                    print("Couldn't retrieve a transcript at", transcript_link)
-
-            db.execute(
-                """
-                UPDATE hansard_transcript
-                    set 
-                        retrieved = :retrieved,
-                        html_ref_page = :html,
-                        transcript_pdf_url = :pdf_link,
-                        transcript_markup_url = :transcript_url,
-                        transcript_markup_type = :markup_type,
-                        transcript_markup = :transcript_markup
-                    where url = :url
-                """,
-                {
-                    "retrieved": now,
-                    "html": html_page,
-                    "pdf_link": pdf_link,
-                    "transcript_url": transcript_link,
-                    "markup_type": transcript_type,
-                    "transcript_markup": transcript_markup,
-                    "url": url,
-                },
-            )
+    # Several browsers run at once, so keep them from opening windows.
+    options.add_argument("-headless")
 
-            db.execute("commit")
+    # Escape hatch via environment variables if geckodriver is installed
+    # somewhere interesting, such as a snap on linux.
+    if geckodriver_path := os.environ.get("WEBDRIVER_GECKO_DRIVER", None):
+        service = webdriver.FirefoxService(geckodriver_path)
+    else:
+        service = webdriver.FirefoxService()
 
-        except Exception as e:
-            failures += 1
-            print(traceback.format_exc())
-            print(
-                f"Uncaught exception for {transcript_link} with {url} - transcript not "
-                "retrieved, continuing"
-            )
+    driver = webdriver.Firefox(options=options, service=service)
 
-            db.execute("rollback")
+    # This is a simple site - just rely on a basic page load timeout.
+    driver.set_page_load_timeout(10)
 
-            # If multiple failures happen just exit - there might be a problem with the
-            # retrieval method, or just an outage within parlinfo.
-            if failures >= 10:
-                break
-            else:
-                continue
+    return driver
 
 
 if __name__ == "__main__":
@@ -434,7 +759,10 @@ if __name__ == "__main__":
 
     args = sys.argv[1:]
 
-    db = sqlite3.connect("transcripts_progress.db", isolation_level=None)
+    # The connection is shared with the transcript retrieval threads.
+    db = sqlite3.connect(
+        "transcripts_progress.db", isolation_level=None, check_same_thread=False
+    )
 
     db.executescript("""
         CREATE table if not exists sitemap(
@@ -456,42 +784,54 @@ if __name__ == "__main__":
             transcript_pdf_url text,
             transcript_markup_url text,
             transcript_markup_type text,
-            transcript_markup text
+            transcript_markup text,
+            html_ref_page_zstd blob,
+            transcript_markup_zstd blob
+        );
+
+        CREATE index if not exists sitemap_url_lastmod on sitemap(url, lastmod);
+
+        -- Covering index for finding transcripts that need retrieval, in order.
+        CREATE index if not exists hansard_retrieval on hansard_transcript(
+            lastmod,
+            retrieved,
+            url
         );
 
         pragma journal_mode=WAL;
         """)
 
+    # Add the compressed columns to databases created before they existed.
+    columns = {row[1] for row in db.execute("pragma table_info(hansard_transcript)")}
+
+    for column in ("html_ref_page_zstd", "transcript_markup_zstd"):
+        if column not in columns:
+            db.execute(f"ALTER table hansard_transcript add column {column} blob")
+
+    compress_stored_pages(db)
+
     if "--full-refresh-sitemap" in args:
         db.execute("DELETE from sitemap")
         db.execute("DELETE from process_data where key = 'last_full_refresh_time")
+        db.execute("DELETE from process_data where key like 'etag:%'")
 
-    with tempfile.TemporaryDirectory(dir=".") as tempdir:
-        options = webdriver.FirefoxOptions()
-
-        # The download options are necessary to handle the SGML files with mixed
-        # application/content-type headers that lead to strange behaviour.
-        options.set_preference("browser.download.dir", tempdir)
-        options.set_preference("browser.download.folderList", 2)
+    # Check and update the sitemap - this doesn't need the browser.
+    asyncio.run(init_and_refresh_sitemap(db))
+    identify_transcripts_to_retrieve(db)
 
-        # Escape hatch via environment variables if geckodriver is installed
-        # somewhere interesting, such as a snap on linux.
-        if geckodriver_path := os.environ.get("WEBDRIVER_GECKO_DRIVER", None):
-            service = webdriver.FirefoxService(geckodriver_path)
-        else:
-            service = webdriver.FirefoxService()
+    # Number of browsers retrieving transcripts in parallel - each keeps to the same
+    # slow pace, so this is also the multiple of the overall request rate.
+    n_drivers = 3
 
-        driver = webdriver.Firefox(options=options, service=service)
+    drivers = []
 
-        # This is a simple site - just rely on a basic page load timeout.
-        driver.set_page_load_timeout(10)
+    try:
+        for _ in range(n_drivers):
+            drivers.append(start_driver())
 
-        try:
+        # Retrieve any new or updated transcripts
+        retrieve_transcripts(drivers, db)
 
-            # Check and update transcripts
-            init_and_refresh_sitemap(driver, db)
-            identify_transcripts_to_retrieve(db)
-            retrieve_transcripts(driver, db, tempdir)
-
-        finally:
+    finally:
+        for driver in drivers:
             driver.quit()
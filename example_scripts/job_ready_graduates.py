@@ -25,7 +25,7 @@ import datetime
 import sqlite3
 
 from openpyxl import Workbook
-from openpyxl.worksheet.hyperlink import Hyperlink
+from openpyxl.cell import WriteOnlyCell
 
 # Note - isolation_level=None won't work in future versions of Python (sometime after
 # 3.13), this should be using the autocommit=True value instead, but requires some
@@ -33,26 +33,52 @@ from openpyxl.worksheet.hyperlink import Hyperlink
 db = sqlite3.connect("oz_federal_hansard.db", isolation_level=None)
 
 
+# The full text indexes narrow down the candidates using the tokenised phrase, which
+# covers both "job-ready" and "job ready" - the glob is then applied to this much
+# smaller set to match the phrase precisely.
 query = """
-    WITH matching_debate as (
+    WITH matching_debate as materialized (
         /* All debates containing the search phrase */
         select 
             debate_id
         from debate 
         inner join session using(session_id) 
-        where lower(title) glob '*job?ready graduates*'
+        where debate_id in (
+                select rowid 
+                from debate_fts 
+                where debate_fts match '"job ready graduates"'
+            )
+            and lower(title) glob '*job?ready graduates*'
             and date >= '2020-01-01'
 
     ),
-    matching_speech as (
+    matching_speech as materialized (
         /* All speech units containing the search phrase */
         select distinct
             session_id, 
             fragment_number 
         from paragraph 
         inner join session using(session_id) 
-        where lower(paragraph_text) glob '*job?ready graduates*' 
+        where para_id in (
+                select rowid 
+                from paragraph_fts 
+                where paragraph_fts match '"job ready graduates"'
+            )
+            and lower(paragraph_text) glob '*job?ready graduates*' 
             and date >= '2020-01-01'
+    ),
+    matching_paragraph as (
+        /* Paragraphs in matching speeches or debates - as a union so that each side
+           can use an index on paragraph. */
+        select para_id
+        from paragraph
+        inner join matching_speech using(session_id, fragment_number)
+
+        union
+
+        select para_id
+        from paragraph
+        inner join matching_debate using(debate_id)
     )
 
     select 
@@ -65,7 +91,8 @@ query = """
         party.name as party,
         paragraph.paragraph_text,
         lower(paragraph_text) glob '*job?ready graduates*' as matches_phrase
-    from paragraph
+    from matching_paragraph
+    inner join paragraph using(para_id)
     inner join session using(session_id)
     inner join debate using(debate_id)
     left outer join parliamentarian on speaker_id = parliamentarian.phid
@@ -73,17 +100,14 @@ query = """
         and session.date between party_member.start_date and 
             coalesce(party_member.end_date, '3000-01-01')
     left outer join party using(party_id)
-    where (paragraph.session_id, fragment_number) in (
-        select session_id, fragment_number from matching_speech
-    ) or debate_id in (
-        select debate_id from matching_debate
-    )
-    order by session.date
+    order by session.date, para_id
 
 """
 
-workbook = Workbook()
-worksheet = workbook.active
+# Write only mode streams rows out to the file, rather than keeping every cell in
+# memory.
+workbook = Workbook(write_only=True)
+worksheet = workbook.create_sheet()
 
 results = db.execute(query)
 
@@ -92,22 +116,17 @@ header = [col[0] for col in results.description]
 worksheet.append(header)
 
 for row in results:
-    row = list(row)
+    cells = list(row)
     # Save date as a proper datetime.
     date = row[0]
-    row[0] = datetime.date.fromisoformat(date)
-
-    worksheet.append(row)
-
-# Update transcript link to be a proper hyperlink
-all_rows = worksheet.rows
-next(all_rows)  # skip header
+    cells[0] = datetime.date.fromisoformat(date)
 
-for row in all_rows:
-    link = row[2].value
+    # Transcript link as a proper hyperlink
+    link_cell = WriteOnlyCell(worksheet, value="Session Transcript")
+    link_cell.hyperlink = row[2]
+    cells[2] = link_cell
 
-    row[2].hyperlink = link
-    row[2].value = "Session Transcript"
+    worksheet.append(cells)
 
 
 workbook.save("job_ready_graduates_speeches.xlsx")
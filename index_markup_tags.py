@@ -12,62 +12,116 @@ fragments for comparison with other processing.
 # /// script
 # requires-python = ">=3.12"
 # dependencies = [
-#   "lxml"
+#   "lxml",
+#   "zstandard"
 # ]
 # ///
 
 import collections
 import concurrent.futures as cf
+import itertools
+import multiprocessing
+import queue
+import re
 import sqlite3
 
-from html.parser import HTMLParser
+import lxml.etree
+import zstandard as zstd
 
-import lxml.html
+# Retrieved pages and transcripts are stored zstd compressed - each worker process
+# decompresses its own inputs.
+decompressor = zstd.ZstdDecompressor()
 
+# The number of tasks submitted to the process pool at once, and the number of results
+# inserted into the database in each transaction.
+max_in_flight = 64
+batch_size = 256
 
-class StartEndTagParser(HTMLParser):
-    """
-    Investigate validity of tags across all the transcripts.
 
-    This is to:
+def map_bounded(pool, fn, rows, max_in_flight=max_in_flight):
+    """
+    Yield fn(*row) for each of the rows from the pool, in order.
 
-    1. Infer the structure of the SGML and which tags have implied optional start/ends
-    2. Confirm the basic structural validity (or not) of the XML.
+    Tasks are submitted as results are consumed, so at most max_in_flight transcripts
+    are held in memory or waiting on the pool at once.
 
     """
+    in_flight = collections.deque()
 
-    def __init__(self):
-        super().__init__()
-        self.start_tag_counts = collections.Counter()
-        self.end_tag_counts = collections.Counter()
-
-    @property
-    def tag_total_counts(self):
+    for row in rows:
+        in_flight.append(pool.submit(fn, *row))
 
-        keys = set(self.start_tag_counts) | set(self.end_tag_counts)
+        if len(in_flight) >= max_in_flight:
+            yield in_flight.popleft().result()
 
-        return {
-            key: (self.start_tag_counts[key], self.end_tag_counts[key]) for key in keys
-        }
+    while in_flight:
+        yield in_flight.popleft().result()
 
-    def handle_starttag(self, tag, attrs):
-        self.start_tag_counts[tag] += 1
 
-    def handle_endtag(self, tag):
-        self.end_tag_counts[tag] += 1
+# Start and end tags as written in the markup, skipping comments. This follows
+# html.parser's handling of attributes: quoted values can contain >, and unquoted
+# values run to the next whitespace or >, so they can contain quotes and slashes. A /
+# before the > marks a self closing tag, unless it's the end of an unquoted value.
+# Each character can only be matched one way, and the repetition is possessive, so
+# a < with no closing > fails without backtracking.
+tag_pattern = re.compile(
+    rb"<!--.*?-->"
+    rb"|<(/?)([a-zA-Z][^\t\n\r\f />\x00]*)"
+    rb"(?:(?>=+\s*(?:\"[^\"]*\"|'[^']*'|[^\s\"'>][^\s>]*)?)|[^=>/]|/(?!>))*+"
+    rb"(/?)>",
+    re.DOTALL,
+)
 
 
-def count_tags(transcript_key, transcript_type, transcript_str):
+def count_tags(transcript_key, transcript_type, transcript_zstd):
     """
     Extract the set of tag paths existing in the transcript.
 
+    This is to investigate validity of tags across all the transcripts, to:
+
+    1. Infer the structure of the SGML and which tags have implied optional start/ends
+    2. Confirm the basic structural validity (or not) of the XML.
+
+    Tags are tokenised with a regex rather than a parser, so the scanning happens in C
+    and only the tags themselves are handled in Python. This also means that tags are
+    counted exactly as written - an HTML or XML parser would fill in the implied
+    start and end tags we're trying to find.
+
     """
 
-    parser = StartEndTagParser()
+    # The transcript is scanned as UTF-8 bytes - only the distinct tag names are
+    # decoded.
+    transcript_bytes = decompressor.decompress(transcript_zstd)
 
-    parser.feed(transcript_str)
+    # Count the distinct (end slash, tag, self closing slash) matches first - this is
+    # done in C, so the Python loop below only sees each distinct spelling of a tag
+    # once rather than every occurrence.
+    tag_match_counts = collections.Counter(tag_pattern.findall(transcript_bytes))
 
-    all_tags = parser.tag_total_counts
+    start_tag_counts = {}
+    end_tag_counts = {}
+
+    for (end_slash, tag, self_closing), count in tag_match_counts.items():
+
+        # Comments only
+        if not tag:
+            continue
+
+        tag = tag.decode("utf-8").lower()
+
+        if end_slash:
+            end_tag_counts[tag] = end_tag_counts.get(tag, 0) + count
+        else:
+            start_tag_counts[tag] = start_tag_counts.get(tag, 0) + count
+
+            # Self closing tags count as both a start and an end.
+            if self_closing:
+                end_tag_counts[tag] = end_tag_counts.get(tag, 0) + count
+
+    all_tags = {
+        key: (start_tag_counts.get(key, 0), end_tag_counts.get(key, 0))
+        for key in start_tag_counts.keys() | end_tag_counts.keys()
+    }
 
     return (
         transcript_key,
@@ -76,22 +130,90 @@ def count_tags(transcript_key, transcript_type, transcript_str):
     )
 
 
-def insert_tag_counts(db, extracted_tag_counts):
-    """Insert extracted tag counts into the DB."""
+def tag_count_rows(extracted_tag_counts):
+    """Rows of the transcript_tag table for the extracted tag counts."""
 
     for transcript_key, transcript_type, tags in extracted_tag_counts:
-        db.executemany(
-            """
-            INSERT into transcript_tag values (?, ?, ?, ?, ?)
-            """,
-            (
-                (transcript_key, transcript_type, tag, start_count, end_count)
-                for tag, (start_count, end_count) in tags.items()
-            ),
-        )
+        for tag, (start_count, end_count) in tags.items():
+            yield transcript_key, transcript_type, tag, start_count, end_count
+
+
+def write_rows(db_path, inserts):
+    """
+    Execute batches of (statement, rows) inserts from the queue until None is received.
+
+    This runs in its own thread with its own connection, so that inserting into the
+    database overlaps with collecting results from the process pool. Each batch is
+    committed as its own transaction, so the WAL can be checkpointed as we go rather
+    than growing for the whole run.
+
+    """
+
+    index_db = sqlite3.connect(db_path, isolation_level=None)
+
+    while (batch_inserts := inserts.get()) is not None:
+
+        index_db.execute("begin")
+
+        for statement, rows in batch_inserts:
+            index_db.executemany(statement, rows)
+
+        index_db.execute("commit")
+        index_db.execute("pragma wal_checkpoint(PASSIVE)")
+
+    index_db.close()
+
+
+def put_checked(items, item, writer):
+    """
+    Queue an item for the writer thread, raising its error if it has stopped.
+
+    """
+    while True:
+        try:
+            items.put(item, timeout=1)
+            return
+        except queue.Full:
+            if writer.done():
+                writer.result()
+                raise RuntimeError("The writer stopped before all items were queued")
+
+
+class TocCounter:
+    """
+    Parser target counting the items and links in the parlinfo table of contents.
+
+    The table of contents is the ul element with the id tocMenu - every li and a
+    element inside it is counted, including in nested lists.
+
+    """
+
+    def __init__(self):
+        self.toc_depth = 0
+        self.item_count = 0
+        self.link_count = 0
 
+    def start(self, tag, attrib):
+        if self.toc_depth:
+            if tag == "li":
+                self.item_count += 1
+            elif tag == "a":
+                self.link_count += 1
+            elif tag == "ul":
+                self.toc_depth += 1
 
-def count_parlinfo_nav_items(transcript_key, html_str):
+        elif tag == "ul" and attrib.get("id") == "tocMenu":
+            self.toc_depth = 1
+
+    def end(self, tag):
+        if self.toc_depth and tag == "ul":
+            self.toc_depth -= 1
+
+    def close(self):
+        return self.item_count, self.link_count
+
+
+def count_parlinfo_nav_items(transcript_key, html_zstd):
     """
     Count the table of contents items for each day's transcript from the HTML.
 
@@ -101,12 +223,52 @@ def count_parlinfo_nav_items(transcript_key, html_str):
 
     """
 
-    parsed = lxml.html.fromstring(html_str)
+    # Count in a single pass as the page is parsed, without building the tree.
+    parser = lxml.etree.HTMLParser(target=TocCounter(), encoding="utf-8")
+
+    toc_item_count, toc_link_count = lxml.etree.fromstring(
+        decompressor.decompress(html_zstd), parser
+    )
+
+    return transcript_key, toc_item_count, toc_link_count
+
+
+# Each worker process reads the transcripts it processes from its own connection to
+# the transcripts database, so only the url is sent to the worker rather than the
+# page and transcript themselves. The connection is opened once by the pool's
+# initializer.
+worker_transcript_db = None
+
+
+def init_worker():
+    """
+    Set up the state shared by all the tasks in a worker process.
+
+    """
+    global worker_transcript_db
+
+    worker_transcript_db = sqlite3.connect("transcripts_progress.db")
+
 
-    nav_hierarchy_items = parsed.xpath("//ul[@id='tocMenu']//li")
-    nav_links = parsed.xpath("//ul[@id='tocMenu']//a")
+def index_transcript(transcript_key):
+    """
+    Count the table of contents items and the tags for a transcript.
 
-    return transcript_key, len(nav_hierarchy_items), len(nav_links)
+    """
+
+    html_zstd, transcript_type, transcript_zstd = worker_transcript_db.execute(
+        """
+        SELECT html_ref_page_zstd, transcript_markup_type, transcript_markup_zstd
+        from hansard_transcript
+        where url = ?
+        """,
+        (transcript_key,),
+    ).fetchone()
+
+    return (
+        count_parlinfo_nav_items(transcript_key, html_zstd),
+        count_tags(transcript_key, transcript_type, transcript_zstd),
+    )
 
 
 if __name__ == "__main__":
@@ -114,8 +276,7 @@ if __name__ == "__main__":
     transcript_db = sqlite3.connect("transcripts_progress.db", isolation_level=None)
     index_db = sqlite3.connect("transcript_markup_index.db", isolation_level=None)
 
-    index_db.executescript(
-        """
+    index_db.executescript("""
         DROP table if exists transcript_tag;
         DROP table if exists transcript_toc;
 
@@ -136,81 +297,62 @@ if __name__ == "__main__":
 
 
         pragma journal_mode=WAL;
-        """
-    )
-
-    with cf.ProcessPoolExecutor(8) as pool:
-
-        index_db.execute("begin")
-
-        # Process HTML to get the table of contents number of items for each transcript
-        html_tables_of_contents = transcript_db.execute(
-            """
-            SELECT url, html_ref_page
-            from hansard_transcript
-            where retrieved is not null
-                and transcript_markup is not null
-            order by url
-            """
-        )
-
-        tasks_in_flight = set()
-        toc_processed = 0
-
-        # Unlike the transcript processing this is fast, so doesn't really need a
-        # process pool, but since we have it set up anyway...
-        for url, html_toc in html_tables_of_contents:
-
-            tasks_in_flight.add(pool.submit(count_parlinfo_nav_items, url, html_toc))
-
-            if len(tasks_in_flight) > 200:
-                completed, tasks_in_flight = cf.wait(tasks_in_flight, timeout=1)
-
-                index_db.executemany(
-                    "INSERT into transcript_toc values(?, ?, ?)",
-                    (f.result() for f in completed),
+        """)
+
+    # Results are handed to the writer thread, which inserts them while the main
+    # thread keeps collecting results from the process pool.
+    inserts = queue.Queue(maxsize=16)
+
+    with (
+        # Spawn fresh worker processes instead of forking this one, which has the
+        # writer thread running and may be holding SQLite locks.
+        cf.ProcessPoolExecutor(
+            8,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_worker,
+        ) as pool,
+        cf.ThreadPoolExecutor(1) as writer_pool,
+    ):
+
+        writer = writer_pool.submit(write_rows, "transcript_markup_index.db", inserts)
+
+        try:
+            # Each transcript and its HTML page are read once, and both are processed
+            # by the same task.
+            transcripts = transcript_db.execute("""
+                SELECT url
+                from hansard_transcript
+                where retrieved is not null
+                    and transcript_markup_zstd is not null
+                order by url
+                """)
+
+            transcripts_processed = 0
+
+            # Note that this is done using a process pool because the tag counting is
+            # otherwise quite slow.
+            for batch in itertools.batched(
+                map_bounded(pool, index_transcript, transcripts), batch_size
+            ):
+
+                toc_counts, tag_counts = zip(*batch)
+
+                put_checked(
+                    inserts,
+                    (
+                        ("INSERT into transcript_toc values(?, ?, ?)", toc_counts),
+                        (
+                            "INSERT into transcript_tag values (?, ?, ?, ?, ?)",
+                            tag_count_rows(tag_counts),
+                        ),
+                    ),
+                    writer,
                 )
 
-                toc_processed += len(completed)
-                print("Completed:", toc_processed)
-
-        # Don't forget to process the final batch
-        index_db.executemany(
-            "INSERT into transcript_toc values(?, ?, ?)",
-            (f.result() for f in tasks_in_flight),
-        )
-
-        ## Process the tag counts for each transcript
-        transcripts = transcript_db.execute(
-            """
-            SELECT url, transcript_markup_type, transcript_markup
-            from hansard_transcript
-            where retrieved is not null
-                and transcript_markup is not null
-            order by url
-            """
-        )
-
-        tasks_in_flight = set()
-        transcripts_processed = 0
-
-        # Note that this is done using a process pool because this is otherwise quite
-        # slow.
-        for url, transcript_type, transcript in transcripts:
-
-            tasks_in_flight.add(
-                pool.submit(count_tags, url, transcript_type, transcript)
-            )
-
-            if len(tasks_in_flight) > 200:
-                completed, tasks_in_flight = cf.wait(tasks_in_flight, timeout=1)
-
-                insert_tag_counts(index_db, [f.result() for f in completed])
-
-                transcripts_processed += len(completed)
+                transcripts_processed += len(batch)
                 print("Completed:", transcripts_processed)
 
-        # Don't forget to process the final batch
-        insert_tag_counts(index_db, [f.result() for f in tasks_in_flight])
+        finally:
+            put_checked(inserts, None, writer)
 
-        index_db.execute("commit")
+        writer.result()
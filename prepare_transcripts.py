@@ -10,49 +10,101 @@ certain kinds of information difficult to extract.
 
 # /// script
 # requires-python = ">=3.12"
+# dependencies = [
+#   "lxml",
+#   "zstandard"
+# ]
 # ///
 
 import collections
 import concurrent.futures as cf
-import dataclasses as dc
 import html
-import itertools
+import io
+import multiprocessing
+import queue
 import re
 import sqlite3
-import xml.etree.ElementTree as ET
+import typing
 
+from lxml import etree as ET
+import zstandard as zstd
 
-@dc.dataclass
-class TranscriptContext:
-    """Keeps track of all enclosing context for an element."""
+# Retrieved transcripts are stored zstd compressed - each worker process decompresses
+# its own inputs.
+decompressor = zstd.ZstdDecompressor()
 
-    debate_info: tuple = dc.field(default_factory=tuple)
-    enclosing_tags: set = dc.field(default_factory=set)
-    speaker: dict = dc.field(default_factory=dict)
-    fragment_number: int = 0
-    fragment_type: str = None
+# One parser per worker process, reused for every transcript. Comments and processing
+# instructions are dropped so they don't show up as nodes in the walk, matching the
+# behaviour of the standard library etree.
+xml_parser = ET.XMLParser(
+    encoding="utf-8", huge_tree=True, remove_comments=True, remove_pis=True
+)
 
 
-def process_debate_info(element):
+class DebateInfo(typing.NamedTuple):
+    """The fields of a debate or subdebate info element."""
+
+    title: str = None
+    page_no: str = None
+    type: str = None
+
+
+# The position of each DebateInfo field, by the tag of the info element's child.
+debate_info_fields = {"title": 0, "page.no": 1, "type": 2}
+
+
+class TranscriptContext:
     """
-    Extract information about the current state of the debate from the given element.
+    Keeps track of all enclosing context for an element.
 
-    Returns an empty list if this element has no information about the debate.
+    A single context is updated in place as the transcript is walked, and a snapshot
+    is taken for each paragraph. The frozen copy of the enclosing tags is shared by
+    snapshots until the enclosing tags change, which must reset it to None.
 
     """
 
-    info = []
+    __slots__ = (
+        "debate_info",
+        "enclosing_tags",
+        "frozen_enclosing_tags",
+        "speaker_id",
+        "fragment_number",
+        "fragment_type",
+    )
+
+    def __init__(
+        self,
+        debate_info=(),
+        enclosing_tags=None,
+        speaker_id=None,
+        fragment_number=0,
+        fragment_type=None,
+    ):
+        self.debate_info = debate_info
+        self.enclosing_tags = set() if enclosing_tags is None else enclosing_tags
+        self.frozen_enclosing_tags = None
+        self.speaker_id = speaker_id
+        self.fragment_number = fragment_number
+        self.fragment_type = fragment_type
+
+    def snapshot(self):
+        """Return an independent copy of the current state of the context."""
+        if self.frozen_enclosing_tags is None:
+            self.frozen_enclosing_tags = frozenset(self.enclosing_tags)
+
+        return TranscriptContext(
+            self.debate_info,
+            self.frozen_enclosing_tags,
+            self.speaker_id,
+            self.fragment_number,
+            self.fragment_type,
+        )
 
-    if element.tag in ("debate"):
-        # Note slightly awkward - the standard library etree doesn't support full xpath
-        for debateinfo in itertools.chain(
-            # debateinfo is standard, there's a couple of instances of debate.info
-            element.findall("debateinfo"),
-            element.findall("debate.info"),
-        ):
-            info.append({elem.tag: elem.text for elem in debateinfo})
 
-    elif element.tag in (
+# Tag sets used to dispatch on element tags in the transcript walk.
+
+subdebate_tags = frozenset(
+    (
         # Standard forms:
         "subdebate.1",
         "subdebate.2",
@@ -61,17 +113,54 @@ def process_debate_info(element):
         # Mispellings/potential misuse
         "subdeabte.1",
         "subdebate",
-    ):
+    )
+)
 
-        for debateinfo in itertools.chain(
-            # Standard
-            element.findall("subdebateinfo"),
-            # Couple of elements only
-            element.findall("subdebateinfo.1"),
-        ):
-            info.append({elem.tag: elem.text for elem in debateinfo})
+# The debate info elements, and the tags of the debate or subdebate elements they can
+# describe.
+debate_info_parent_tags = {
+    # debateinfo is standard, there's a couple of instances of debate.info
+    "debateinfo": frozenset(("debate",)),
+    "debate.info": frozenset(("debate",)),
+    # Standard
+    "subdebateinfo": subdebate_tags,
+    # Couple of elements only
+    "subdebateinfo.1": subdebate_tags,
+}
 
-    return info
+# Elements that are only read once they're complete - their children need to stay
+# around until the end event for the element itself.
+capture_tags = frozenset(("session.header", "talker", *debate_info_parent_tags))
+
+fragment_tags = frozenset(
+    ("speech", "motionnospeech", "petition", "question", "answer")
+)
+skipped_tags = frozenset(("debate.text", "subdebate.text"))
+paragraph_tags = frozenset(("p", "para"))
+
+
+def process_debate_info(element):
+    """
+    Extract information about the current state of the debate from the given element.
+
+    The element is a candidate debate info element - returns None if it doesn't
+    describe the debate or subdebate that encloses it.
+
+    """
+
+    parent_tags = debate_info_parent_tags.get(element.tag)
+
+    if parent_tags is None or element.getparent().tag not in parent_tags:
+        return None
+
+    fields = [None, None, None]
+
+    for elem in element:
+        field = debate_info_fields.get(elem.tag)
+        if field is not None:
+            fields[field] = elem.text
+
+    return DebateInfo._make(fields)
 
 
 def remove_para_markup(paragraph):
@@ -80,87 +169,130 @@ def remove_para_markup(paragraph):
 
     """
 
-    extracted_text = "".join(paragraph.itertext())
+    # Serialising as text gathers the text of the whole subtree in C - the equivalent
+    # of lxml.html's text_content(), which isn't available on lxml.etree elements.
+    extracted_text = ET.tostring(
+        paragraph, method="text", encoding="unicode", with_tail=False
+    )
 
     return " ".join(extracted_text.split())
 
 
-def process_xml_transcript(transcript_key, transcript_pdf_url, xml_str):
+def process_xml_transcript(transcript_key, transcript_pdf_url, xml_zstd):
     """
     Extract text units from XML transcripts, with sufficient information about context.
     """
 
-    root = ET.fromstring(xml_str)
+    # lxml parses the raw UTF-8 bytes directly, with no intermediate decode to str.
+    events = ET.iterparse(
+        io.BytesIO(decompressor.decompress(xml_zstd)),
+        events=("start", "end"),
+        encoding="utf-8",
+        huge_tree=True,
+        remove_comments=True,
+        remove_pis=True,
+    )
 
-    # Session information first - this is the basic information about the date, house,
+    # Session information - this is the basic information about the date, house,
     # etc. and is the same across all of the elements in this transcript.
-    session = root.find("session.header")
-    session_info = {elem.tag: elem.text for elem in session}
+    session_info = None
 
     # The context holds information from the parent elements - it may be added or
-    # extended as processing continues.
+    # extended as processing continues. The tree is streamed in document order so we
+    # still process in depth first order and can assign sensible sequence numbers to
+    # the output processed items. The context is updated in place: each open element
+    # has an undo record of the tag it added to the enclosing tags (if any), which is
+    # removed when the element closes. Debate info is only ever appended, along with
+    # the depth of the element it describes, and is truncated when that element closes.
     context = TranscriptContext()
-
-    # Note we're using a while loop and a queue to avoid Python limitations with
-    # recursion. We still process in depth first order though so we can assign sensible
-    # sequence numbers to the output processed items.
-
-    to_process = [(context, root)]
+    undo = []
+    # The depth of 0 is never closed, so there's always an entry to compare with.
+    debate_info_depths = [0]
     processed = []
-    speaker = {}
+    speaker_id = None
+
+    # Bound once up front - these are called for nearly every element so it's worth
+    # skipping the attribute lookups in the loop.
+    enclosing_tags = context.enclosing_tags
+    add_enclosing_tag = enclosing_tags.add
+    discard_enclosing_tag = enclosing_tags.discard
+    push_undo = undo.append
+    pop_undo = undo.pop
 
     fragment_number = 0
     fragment_type = None
 
-    while to_process:
+    # Depth counters for subtrees that are handled as a unit rather than element by
+    # element.
+    in_paragraph = 0
+    in_skipped = 0
+    in_capture = 0
 
-        context, element = to_process.pop()
+    for event, element in events:
 
         tag = element.tag
 
-        # There's mostly no title associated with these, but they are still distinct
-        # procedural units. Notes:
-        #   - Questions and answers are usually part of the same fragment
-        #   - petitions rarely have embedded speeches - in some cases this will generate
-        #     a fragment_number that isn't used.
-        if tag in ("speech", "motionnospeech", "petition", "question", "answer"):
-            fragment_number += 1
-            fragment_type = tag
-
-        # Extract debate info if present.
-        new_debate_info = process_debate_info(element)
-
-        if new_debate_info:
-            last_speaker = {}
-
-            # Reset speakers when new debate context is started.
-            context = dc.replace(
-                context,
-                debate_info=tuple(
-                    itertools.chain(context.debate_info, new_debate_info)
-                ),
-                speaker={},
-            )
+        if event == "start":
+
+            if in_paragraph:
+                in_paragraph += 1
+
+            elif in_skipped:
+                in_skipped += 1
+
+            # Skip these (for now) - they occur only in the newest transcript format
+            # and are equivalent to the debate_info we've already collected. The only
+            # reason to look deeper into this is that for some areas such as bills, the
+            # reference IDs of the bills are (now) included in this section but not the
+            # debate info.
+            elif tag in skipped_tags:
+                in_skipped = 1
+
+            # The paragraphs are the leaf nodes - everything inside them is collected
+            # as text when the paragraph is complete.
+            elif tag in paragraph_tags:
+                in_paragraph = 1
+
+            else:
+                # There's mostly no title associated with these, but they are still
+                # distinct procedural units. Notes:
+                #   - Questions and answers are usually part of the same fragment
+                #   - petitions rarely have embedded speeches - in some cases this will
+                #     generate a fragment_number that isn't used.
+                if tag in fragment_tags:
+                    fragment_number += 1
+                    fragment_type = tag
+
+                if tag in capture_tags:
+                    in_capture += 1
+
+                # Pass through - the set of parent tags for this particular context.
+                # This is so we can defer processing a bit further down the track as
+                # most of these might only need a present/absent flag to indicate
+                # important structure.
+                if tag in enclosing_tags:
+                    push_undo(None)
+                else:
+                    add_enclosing_tag(tag)
+                    context.frozen_enclosing_tags = None
+                    push_undo(tag)
 
-        # Speaker information varies quite a bit.
-        # In newer transcripts, the talker tag appears only at the start of the speech
-        # for the person who has the procedural floor - the actual speaker and changes
-        # in speakers are marked in the individual p tags inside the talk.text entry and
-        # interjections/continuations are only
-        elif tag == "talker":
-            speaker = {elem.tag: elem.text for elem in element}
-            context = dc.replace(context, speaker=speaker)
-
-        # Skip these (for now) - they occur only in the newest transcript format and are
-        # equivalent to the debate_info we've already collected. The only reason to
-        # look deeper into this is that for some areas such as bills, the reference IDs
-        # of the bills are (now) included in this section but not the debate info.
-        elif tag in ("debate.text", "subdebate.text"):
             continue
 
+        # End events from here on.
+        if in_paragraph > 1:
+            in_paragraph -= 1
+            continue
+
+        elif in_skipped:
+            in_skipped -= 1
+            if in_skipped:
+                continue
+
         # Finally - the thing we actually care about - the paragraphs of text
         # TODO: handle context from the p elements in the newer style transcripts.
-        elif tag in ("p", "para"):
+        elif in_paragraph:
+            in_paragraph = 0
 
             # TODO: handle procedural stuff, like speaker names embedded in the text.
             paragraph_text = remove_para_markup(element)
@@ -174,40 +306,74 @@ def process_xml_transcript(transcript_key, transcript_pdf_url, xml_str):
 
                 if anchor is not None:
                     if "href" in anchor.attrib:
-                        speaker = {}
-                        speaker["name.id"] = anchor.attrib["href"]
+                        speaker_id = anchor.attrib["href"]
 
             # Always attach the current speaker reference - this means that runs of
             # paragraphs without otherwise attributing the speaker be assigned
             # implicitly to the same speaker.
-            context = dc.replace(
-                context,
-                speaker=speaker,
-                fragment_number=fragment_number,
-                fragment_type=fragment_type,
-            )
-
-            processed.append((context, paragraph_text))
-
-            # Continue as the leaf nodes are the p/para elements.
+            context.speaker_id = speaker_id
+            context.fragment_number = fragment_number
+            context.fragment_type = fragment_type
+
+            processed.append((context.snapshot(), paragraph_text))
+
+        else:
+            added_tag = pop_undo()
+            if added_tag is not None:
+                discard_enclosing_tag(added_tag)
+                context.frozen_enclosing_tags = None
+
+            while debate_info_depths[-1] > len(undo):
+                debate_info_depths.pop()
+                context.debate_info = context.debate_info[:-1]
+
+            if tag == "session.header":
+                session_info = {elem.tag: elem.text for elem in element}
+
+            # Speaker information varies quite a bit.
+            # In newer transcripts, the talker tag appears only at the start of the
+            # speech for the person who has the procedural floor - the actual speaker
+            # and changes in speakers are marked in the individual p tags inside the
+            # talk.text entry and interjections/continuations are only
+            elif tag == "talker":
+                speaker_id = None
+                for elem in element:
+                    if elem.tag == "name.id":
+                        speaker_id = elem.text
+
+            # Extract debate info if present - this extends the context of the
+            # enclosing debate for the rest of its children.
+            elif tag in capture_tags:
+                new_debate_info = process_debate_info(element)
+
+                if new_debate_info is not None:
+                    context.debate_info = context.debate_info + (new_debate_info,)
+                    debate_info_depths.append(len(undo))
+
+            if tag in capture_tags:
+                in_capture -= 1
+
+        # Children of captured elements are still needed by the captured element.
+        if in_capture:
             continue
 
-        # Pass through - the set of parent tags for this particular context. This is so
-        # we can defer processing a bit further down the track as most of these might
-        # only need a present/absent flag to indicate important structure.
-        context = dc.replace(
-            context, enclosing_tags=context.enclosing_tags | set([tag])
-        )
-
-        # Prep children for processing - note we append in reverse order so that the
-        # depth first order is preserved.
-        children = reversed(element)
-        for child in children:
-            to_process.append((context, child))
+        # Release everything that has been completely processed.
+        element.clear()
+        while element.getprevious() is not None:
+            del element.getparent()[0]
 
     return transcript_key, transcript_pdf_url, "xml", session_info, processed
 
 
+insert_session = """
+    INSERT into session(session_id, url, transcript_pdf_url, date, chamber)
+        values(?, ?, ?, ?, ?)
+    """
+insert_debate = "INSERT into debate values(?, ?, ?, ?)"
+insert_paragraph = "INSERT into paragraph values(null, ?, ?, ?, ?, ?, ?, ?)"
+insert_enclosing_context = "INSERT into paragraph_enclosing_context values(?, ?, ?)"
+
+
 def insert_processed_xml_transcript_detail(
     processed_db,
     session_id,
@@ -220,14 +386,14 @@ def insert_processed_xml_transcript_detail(
     """
     Insert final processed data into the database.
 
+    Rows are collected for the whole transcript and inserted with one executemany per
+    table.
+
     """
 
     # Insert the session details.
     processed_db.execute(
-        """
-        INSERT into session(session_id, url, transcript_pdf_url, date, chamber) 
-            values(?, ?, ?, ?, ?)
-        """,
+        insert_session,
         (
             session_id,
             url,
@@ -239,23 +405,21 @@ def insert_processed_xml_transcript_detail(
 
     # speaker_keys = set()
 
+    debate_rows = []
+    paragraph_rows = []
+    enclosing_rows = []
+
     last_debate_title = None
     next_debate = debate_id + 1
     debate_no = 1
 
     for sequence_no, (context, paragraph_text) in enumerate(paragraphs):
 
-        debate_title = "\n".join(c.get("title", "") or "" for c in context.debate_info)
+        debate_title = "\n".join(c.title or "" for c in context.debate_info)
 
         # Create a new debate sequence whenever the title changes.
         if debate_title is not None and debate_title != last_debate_title:
-            processed_db.execute(
-                """
-                INSERT into debate values(?, ?, ?, ?)
-
-                """,
-                (next_debate, session_id, debate_no, debate_title),
-            )
+            debate_rows.append((next_debate, session_id, debate_no, debate_title))
 
             debate_id = next_debate
             next_debate += 1
@@ -263,7 +427,7 @@ def insert_processed_xml_transcript_detail(
 
             last_debate_title = debate_title
 
-        speaker_id = context.speaker.get("name.id", None)
+        speaker_id = context.speaker_id
         # parliamentary handbook is all uppercase, but transcripts occassionally use
         # lower case, so normalise
         if speaker_id is not None:
@@ -272,8 +436,7 @@ def insert_processed_xml_transcript_detail(
         fragment_number = context.fragment_number
         fragment_type = context.fragment_type
 
-        processed_db.execute(
-            "INSERT into paragraph values(null, ?, ?, ?, ?, ?, ?, ?)",
+        paragraph_rows.append(
             (
                 session_id,
                 sequence_no,
@@ -282,16 +445,19 @@ def insert_processed_xml_transcript_detail(
                 fragment_number,
                 fragment_type,
                 paragraph_text,
-            ),
+            )
         )
 
-        processed_db.executemany(
-            "INSERT into paragraph_enclosing_context values(?, ?, ?)",
-            ((session_id, sequence_no, tag) for tag in context.enclosing_tags),
+        enclosing_rows.extend(
+            (session_id, sequence_no, tag) for tag in context.enclosing_tags
         )
 
         # speaker_keys |= set(context.speaker.keys())
 
+    processed_db.executemany(insert_debate, debate_rows)
+    processed_db.executemany(insert_paragraph, paragraph_rows)
+    processed_db.executemany(insert_enclosing_context, enclosing_rows)
+
     return next_debate
 
 
@@ -319,9 +485,28 @@ remove_tags = (
     "tab",
 )
 
+
+def case_insensitive_literal(text):
+    """
+    Pattern matching text in any case, without needing the re.IGNORECASE flag.
+
+    """
+    return "".join(
+        f"[{char.upper()}{char.lower()}]" if char.isalpha() else re.escape(char)
+        for char in text
+    )
+
+
+# All alternatives share the leading '<' and run to the end of the tag. Spelling out
+# the case of each letter instead of using re.IGNORECASE, and matching the rest of the
+# tag with [^>]* instead of a lazy .*?, keeps the regex engine on its fast paths. The
+# SGML is cleaned up as UTF-8 bytes, so the pattern is compiled as bytes.
 remove_tags = re.compile(
-    "|".join(f"</?{tag}.*?>" for tag in remove_tags),
-    re.IGNORECASE | re.MULTILINE | re.DOTALL,
+    (
+        "</?(?:"
+        + "|".join(case_insensitive_literal(tag) for tag in remove_tags)
+        + ")[^>]*>"
+    ).encode("utf-8")
 )
 
 sgml_entity_replacements = {
@@ -344,40 +529,59 @@ sgml_entity_replacements = {
     "&": "&amp;",
 }
 
-entity_detector = re.compile("|".join(sgml_entity_replacements.keys()))
+sgml_entity_replacements_utf8 = tuple(
+    (entity.encode("utf-8"), replacement.encode("utf-8"))
+    for entity, replacement in sgml_entity_replacements.items()
+)
+
+
+def replace_sgml_entities(sgml_bytes):
+    """
+    Replace the known SGML entities with their UTF-8 encoded unicode equivalents.
+
+    Each entity is replaced with a plain bytes.replace pass, in order, rather than a
+    regex with a Python callback per match. Only the final bare ampersand replacement
+    introduces an ampersand, so this gives the same result as matching all of the
+    entities in a single pass.
 
+    """
+    for entity, replacement in sgml_entity_replacements_utf8:
+        sgml_bytes = sgml_bytes.replace(entity, replacement)
 
-def replace_sgml_entity(match):
-    return sgml_entity_replacements[match.group(0)]
+    return sgml_bytes
 
 
-def chop_sgml_doctype(sgml_str):
+def chop_sgml_doctype(sgml_bytes):
     """
     Chop the SGML doctype and associated elements from the start of the document.
 
     All SGML transcripts have an opening hansard tag.
 
     """
-    start = "<HANSARD"
+    start = b"<HANSARD"
 
-    return start + sgml_str.partition(start)[2]
+    return start + sgml_bytes.partition(start)[2]
 
 
-def process_sgml_transcript(transcript_key, transcript_pdf_url, sgml_str):
+def process_sgml_transcript(transcript_key, transcript_pdf_url, sgml_zstd):
     """
     Extract text units from SGML transcripts, with sufficient information about context.
 
     """
 
+    # The transcript stays as UTF-8 bytes throughout, with no decode to str and
+    # encode back for the parser.
+    sgml_bytes = decompressor.decompress(sgml_zstd)
+
     # Chop off the (SGML) doctype declaration.
-    remove_doctype = chop_sgml_doctype(sgml_str)
+    remove_doctype = chop_sgml_doctype(sgml_bytes)
     # Brute force, remove tags we know aren't closed just to see what happens when we
     # parse as if this was XML.
-    removed_unclosed_tags = remove_tags.sub("", remove_doctype)
+    removed_unclosed_tags = remove_tags.sub(b"", remove_doctype)
     # Replace remaining entities with unicode equivalents
-    transformed = entity_detector.sub(replace_sgml_entity, removed_unclosed_tags)
+    transformed = replace_sgml_entities(removed_unclosed_tags)
 
-    root = ET.fromstring(transformed)
+    root = ET.fromstring(transformed, xml_parser)
 
     return transcript_key, transcript_pdf_url, "sgml", None, None
 
@@ -446,6 +650,154 @@ def process_sgml_transcript(transcript_key, transcript_pdf_url, sgml_str):
     # return transcript_key, "sgml", session_info, processed
 
 
+transcript_processors = {
+    "xml": process_xml_transcript,
+    "sgml": process_sgml_transcript,
+}
+
+
+# Each worker process reads the transcripts it processes from its own connection to
+# the transcripts database, so only the url is sent to the worker rather than the
+# transcript itself. The connection is opened once by the pool's initializer.
+worker_transcript_db = None
+
+
+def init_worker():
+    """
+    Set up the state shared by all the tasks in a worker process.
+
+    """
+    global worker_transcript_db
+
+    worker_transcript_db = sqlite3.connect("transcripts_progress.db")
+
+
+def read_transcript(transcript_key):
+    """Read the compressed markup of a transcript in this process."""
+
+    (transcript_zstd,) = worker_transcript_db.execute(
+        "SELECT transcript_markup_zstd from hansard_transcript where url = ?",
+        (transcript_key,),
+    ).fetchone()
+
+    return transcript_zstd
+
+
+def process_transcript(transcript_key, transcript_pdf_url, transcript_type):
+    """Process a transcript with the processor for its markup type."""
+    return transcript_processors[transcript_type](
+        transcript_key, transcript_pdf_url, read_transcript(transcript_key)
+    )
+
+
+# The number of transcripts submitted to the process pool at once.
+max_in_flight = 64
+
+
+def map_bounded(pool, fn, rows, max_in_flight=max_in_flight):
+    """
+    Yield fn(*row) for each of the rows from the pool, in order.
+
+    Tasks are submitted as results are consumed, so at most max_in_flight transcripts
+    are held in memory or waiting on the pool at once.
+
+    """
+    in_flight = collections.deque()
+
+    for row in rows:
+        in_flight.append(pool.submit(fn, *row))
+
+        if len(in_flight) >= max_in_flight:
+            yield in_flight.popleft().result()
+
+    while in_flight:
+        yield in_flight.popleft().result()
+
+
+# Settings for bulk loading - avoid waiting on fsyncs and keep more pages in memory.
+# These apply per connection.
+bulk_load_pragmas = """
+    pragma synchronous=NORMAL;
+    pragma temp_store=MEMORY;
+    pragma cache_size=-262144;
+    pragma mmap_size=268435456;
+    """
+
+
+# The number of transcripts inserted in each transaction.
+commit_every = 500
+
+
+def write_processed_transcripts(db_path, results):
+    """
+    Insert processed transcripts taken from the results queue until None is received.
+
+    This runs in its own thread with its own connection, so that inserting into the
+    database overlaps with collecting results from the process pool.
+
+    """
+
+    processed_db = sqlite3.connect(db_path, isolation_level=None)
+    processed_db.executescript(bulk_load_pragmas)
+
+    processed_db.execute("begin")
+
+    # We generate session_ids and debate_ids sequentially as surrogate keys.
+    # Session IDs map directly to one transcript - debate ids are more complex.
+    session_id = 1
+    next_debate = 1
+
+    while (result := results.get()) is not None:
+
+        (
+            url,
+            transcript_pdf_url,
+            transcript_type,
+            session_info,
+            paragraphs,
+        ) = result
+
+        if transcript_type == "xml":
+            next_debate = insert_processed_xml_transcript_detail(
+                processed_db,
+                session_id,
+                next_debate,
+                url,
+                transcript_pdf_url,
+                session_info,
+                paragraphs,
+            )
+
+        session_id += 1
+
+        # Commit regularly rather than holding one transaction for the whole run, so
+        # the WAL can be checkpointed and doesn't grow without bound.
+        if session_id % commit_every == 0:
+            processed_db.execute("commit")
+            processed_db.execute("pragma wal_checkpoint(PASSIVE)")
+            processed_db.execute("begin")
+
+            print("Completed:", session_id)
+
+    processed_db.execute("commit")
+    processed_db.close()
+
+
+def put_checked(items, item, writer):
+    """
+    Queue an item for the writer thread, raising its error if it has stopped.
+
+    """
+    while True:
+        try:
+            items.put(item, timeout=1)
+            return
+        except queue.Full:
+            if writer.done():
+                writer.result()
+                raise RuntimeError("The writer stopped before all items were queued")
+
+
 # The set of known bad transcripts - these are also cases that need further
 # investigation
 ignore_transcripts = set(
@@ -467,6 +819,8 @@ if __name__ == "__main__":
         DROP table if exists debate;
         DROP table if exists paragraph_enclosing_context;
         DROP table if exists paragraph_enclosed_context;
+        DROP table if exists paragraph_fts;
+        DROP table if exists debate_fts;
 
 
         create table session(
@@ -513,102 +867,83 @@ if __name__ == "__main__":
             foreign key (session_id, sequence_number) references paragraph
         );
 
+        -- Full text indexes for searching paragraphs and debate titles. These are
+        -- external content tables, populated from the base tables after processing.
+        create virtual table paragraph_fts using fts5(
+            paragraph_text,
+            content='paragraph',
+            content_rowid='para_id',
+            tokenize='unicode61'
+        );
+
+        create virtual table debate_fts using fts5(
+            title,
+            content='debate',
+            content_rowid='debate_id',
+            tokenize='unicode61'
+        );
+
         pragma journal_mode=WAL;
         """)
 
+    processed_db.executescript(bulk_load_pragmas)
+
     ## Process the tag counts for each transcript
     transcripts = transcript_db.execute("""
         SELECT 
             url,
             transcript_pdf_url, 
-            transcript_markup_type, 
-            transcript_markup
+            transcript_markup_type
         from hansard_transcript
         where retrieved is not null
-            and transcript_markup is not null
+            and transcript_markup_zstd is not null
             -- and transcript_markup_type = 'sgml'
         order by url
         """)
 
-    processed_db.execute("begin")
-
-    with cf.ProcessPoolExecutor(8) as pool:
-
-        tasks_in_flight = set()
+    # Processed transcripts are handed to the writer thread, which inserts them while
+    # the main thread keeps collecting results from the process pool.
+    results = queue.Queue(maxsize=16)
+
+    with (
+        # Workers are spawned as fresh interpreters rather than forked, as by then the
+        # writer thread could be holding SQLite locks the workers also need. Spawn is
+        # also available on every platform.
+        cf.ProcessPoolExecutor(
+            8,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_worker,
+        ) as pool,
+        cf.ThreadPoolExecutor(1) as writer_pool,
+    ):
 
-        # We generate session_ids and debate_ids sequentially as surrogate keys.
-        # Session IDs map directly to one transcript - debate ids are more complex.
-        session_id = 1
-        next_debate = 1
+        writer = writer_pool.submit(
+            write_processed_transcripts, "oz_federal_hansard.db", results
+        )
 
-        speaker_keys = set()
+        transcripts = (
+            row
+            for row in transcripts
+            if row[0] not in ignore_transcripts and row[2] in transcript_processors
+        )
 
-        for url, transcript_pdf_url, transcript_type, transcript in transcripts:
+        try:
+            for result in map_bounded(pool, process_transcript, transcripts):
+                put_checked(results, result, writer)
+        finally:
+            put_checked(results, None, writer)
 
-            if url in ignore_transcripts:
-                continue
+        writer.result()
 
-            if transcript_type == "xml":
-                tasks_in_flight.add(
-                    pool.submit(
-                        process_xml_transcript, url, transcript_pdf_url, transcript
-                    )
-                )
-
-            elif transcript_type == "sgml":
-                tasks_in_flight.add(
-                    pool.submit(
-                        process_sgml_transcript, url, transcript_pdf_url, transcript
-                    )
-                )
-
-            if len(tasks_in_flight) > 500:
-                completed, tasks_in_flight = cf.wait(
-                    tasks_in_flight, return_when=cf.FIRST_COMPLETED
-                )
-
-                for task in completed:
-                    (
-                        url,
-                        transcript_pdf_url,
-                        transcript_type,
-                        session_info,
-                        paragraphs,
-                    ) = task.result()
-
-                    if transcript_type == "xml":
-                        next_debate = insert_processed_xml_transcript_detail(
-                            processed_db,
-                            session_id,
-                            next_debate,
-                            url,
-                            transcript_pdf_url,
-                            session_info,
-                            paragraphs,
-                        )
-
-                    session_id += 1
-
-                print("Completed:", session_id)
-
-        for task in cf.as_completed(tasks_in_flight):
-            (
-                url,
-                transcript_pdf_url,
-                transcript_type,
-                session_info,
-                paragraphs,
-            ) = task.result()
-            if transcript_type == "xml":
-                next_debate = insert_processed_xml_transcript_detail(
-                    processed_db,
-                    session_id,
-                    next_debate,
-                    url,
-                    transcript_pdf_url,
-                    session_info,
-                    paragraphs,
-                )
-            session_id += 1
+    # Build the full text and lookup indexes in one pass now that all the text is
+    # loaded.
+    processed_db.executescript("""
+        INSERT into paragraph_fts(paragraph_fts) values('rebuild');
+        INSERT into debate_fts(debate_fts) values('rebuild');
 
-    processed_db.execute("commit")
+        CREATE index paragraph_session_fragment on paragraph(
+            session_id, 
+            fragment_number
+        );
+        CREATE index paragraph_debate on paragraph(debate_id);
+        """)